@@ -1,3 +1,4 @@
+import numpy as np
 from typing import List, Dict, Any
 
 def chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[str]:
@@ -8,37 +9,27 @@ def chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[st
     if overlap >= chunk_size:
         overlap = max(0, chunk_size // 5)
 
-    chunks = []
-    start = 0
     n = len(text)
+    step = chunk_size - overlap
 
-    while start < n:
-        end = min(start + chunk_size, n)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
+    # all window bounds up front; the last window is the first one reaching the end of text
+    n_chunks = max(0, -(-(n - chunk_size) // step)) + 1
+    starts = np.arange(n_chunks) * step
+    ends = np.minimum(starts + chunk_size, n)
 
-        if end >= n:
-            break  # ✅ end reached safely
+    return [c for c in (text[a:b].strip() for a, b in zip(starts.tolist(), ends.tolist())) if c]
 
-        next_start = end - overlap
-
-        # ✅ guarantee progress (prevents infinite loop)
-        if next_start <= start:
-            next_start = end
-
-        start = next_start
-
-    return chunks
-
-def chunk_docs(pages: List[Dict[str, Any]], chunk_size: int = 2000, overlap: int = 200):
-    out = []
+def chunk_docs(pages: List[Dict[str, Any]], chunk_size: int = 2000, overlap: int = 200) -> Dict[str, List[Any]]:
+    # parallel lists (texts[i] <-> metadatas[i]); all chunks of a page share that page's metadata dict
+    texts: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
     for p in pages:
         txt = p.get("text") or ""
         # safety cap against insanely large text blobs
         if len(txt) > 2_000_000:
             txt = txt[:2_000_000]
 
-        for c in chunk_text(txt, chunk_size=chunk_size, overlap=overlap):
-            out.append({"text": c, "metadata": p.get("metadata", {})})
-    return out
+        page_chunks = chunk_text(txt, chunk_size=chunk_size, overlap=overlap)
+        texts.extend(page_chunks)
+        metadatas.extend([p.get("metadata", {})] * len(page_chunks))
+    return {"texts": texts, "metadatas": metadatas}
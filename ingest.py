@@ -1,6 +1,11 @@
 import os
+import asyncio
+import json
+import re
 import hashlib
 import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
 from tqdm import tqdm
 from google import genai
@@ -13,27 +18,161 @@ from vectordb import VectorDB
 load_dotenv()
 
 EMBED_MODEL = "gemini-embedding-001"
+VDB_DIR = "data/vdb"
+FILES_SEEN_PATH = os.path.join(VDB_DIR, "files_seen.json")  # {path: [mtime, size]} of fully ingested files
 
 # ---- Free-tier safe limiter (embed items per minute) ----
 ITEMS_PER_MIN_LIMIT = 95   # keep buffer under 100/min
 WINDOW_SECONDS = 60
 BATCH_SIZE = 5             # 5 items/request -> easier to stay under 100/min
+MAX_429_RETRIES = 3
+EMBED_CONCURRENCY = 6      # batches in flight at once (still paced by the token bucket)
+
+class TokenBucket:
+    """
+    Proactive limiter: permits drip in at `rate_per_sec` up to `capacity`,
+    and acquire(n) sleeps only as long as needed for n permits.
+    On a 429 the rate is halved once per episode, then recovers geometrically on each success,
+    and all acquires pause for the retry delay so the quota window can reset.
+    Waiters are served one at a time (FIFO) so concurrent batches can't overdraw.
+    """
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.base_rate = rate_per_sec
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.generation = 0  # bumped on every backoff; see backoff()
+        self.paused_until = 0.0  # monotonic time before which no permits are handed out
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    async def acquire(self, n: int):
+        async with self._lock:
+            pause_s = self.paused_until - time.monotonic()
+            if pause_s > 0:
+                print(f"[rate-limit] quota exhausted, pausing {pause_s:.1f}s...")
+                await asyncio.sleep(pause_s)
+                self.last = time.monotonic()  # nothing drips in while paused
+            self._refill()
+            if self.tokens < n:
+                sleep_s = (n - self.tokens) / self.rate
+                if sleep_s > 1:
+                    print(f"[rate-limit] sleeping {sleep_s:.1f}s to respect embed limit...")
+                await asyncio.sleep(sleep_s)
+                self._refill()
+            self.tokens -= n
+
+    def backoff(self, seen_generation: int, delay_s: float):
+        # every 429 extends the pause (to the latest delay the API asked for) ...
+        self.paused_until = max(self.paused_until, time.monotonic() + delay_s)
+        # ... but requests already in flight when the first 429 lands all carry the same generation:
+        # only the first of them halves the rate, the rest just retry at the already-reduced rate
+        if seen_generation != self.generation:
+            return
+        self.generation += 1
+        self.rate = max(self.base_rate / 64, self.rate / 2)
+        self.tokens = 0.0
+
+    def recover(self):
+        self.rate = min(self.base_rate, self.rate * 1.5)
+
+@lru_cache(maxsize=4096)
+def _id_prefix(source: str, page: int | None):
+    # all chunks of a page share the (source, page) prefix: encode + hash it once, then copy()
+    return hashlib.sha256((source + str(page)).encode("utf-8", errors="ignore"))
+
+def retry_delay_s(e: ClientError) -> float:
+    # honor the RetryInfo.retryDelay (e.g. "38s") the API attaches to a 429; otherwise wait out a full window
+    m = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(e))
+    return float(m.group(1)) if m else float(WINDOW_SECONDS)
 
 def stable_id(source: str, page: int | None, text: str) -> str:
-    h = hashlib.sha256((source + str(page) + text).encode("utf-8", errors="ignore")).hexdigest()
-    return h[:24]
+    h = _id_prefix(source, page).copy()
+    h.update(text.encode("utf-8", errors="ignore"))
+    return h.hexdigest()[:24]
 
-def embed_batch(client: genai.Client, texts: list[str]) -> list[list[float]]:
+async def embed_batch(client: genai.Client, texts: list[str]) -> list[list[float]]:
     print(f"[embed] embedding {len(texts)} chunks...")
     t0 = time.time()
-    res = client.models.embed_content(model=EMBED_MODEL, contents=texts)
+    res = await client.aio.models.embed_content(model=EMBED_MODEL, contents=texts)
     out = [e.values for e in res.embeddings]
     print(f"[embed] done in {time.time() - t0:.2f}s")
     return out
 
+async def embed_with_retry(client: genai.Client, bucket: TokenBucket, sem: asyncio.Semaphore, batch):
+    batch_ids, batch_docs, batch_metas = batch
+    async with sem:
+        for attempt in range(MAX_429_RETRIES + 1):
+            await bucket.acquire(len(batch_docs))
+            generation = bucket.generation
+            try:
+                batch_embs = await embed_batch(client, batch_docs)
+                bucket.recover()
+                return batch_ids, batch_embs, batch_docs, batch_metas
+            except ClientError as e:
+                # If rate-limited, slow the bucket down and retry
+                if ("RESOURCE_EXHAUSTED" in str(e) or "429" in str(e)) and attempt < MAX_429_RETRIES:
+                    delay_s = retry_delay_s(e)
+                    bucket.backoff(generation, delay_s)
+                    print(f"[embed] 429 hit. Waiting {delay_s:.0f}s, then retrying at {bucket.rate * WINDOW_SECONDS:.0f} items/min...")
+                    continue
+                print("\n❌ Gemini embeddings failed:")
+                print(e)
+                raise
+
+async def ingest_all(client: genai.Client, vdb: VectorDB, batches: list):
+    # capacity of one batch: burst + a minute of drip never exceeds the per-minute limit
+    bucket = TokenBucket(ITEMS_PER_MIN_LIMIT / WINDOW_SECONDS, capacity=BATCH_SIZE)
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    tasks = [asyncio.create_task(embed_with_retry(client, bucket, sem, b)) for b in batches]
+
+    # Write PER BATCH from this task as results land (so you never lose progress)
+    try:
+        for fut in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            batch_ids, batch_embs, batch_docs, batch_metas = await fut
+            vdb.add(
+                ids=batch_ids,
+                embeddings=batch_embs,
+                documents=batch_docs,
+                metadatas=batch_metas
+            )
+    finally:
+        for t in tasks:
+            t.cancel()
+
+def process_file(fp: str, pdf_workers: int | None = None):
+    pages = load_document(fp, pdf_workers=pdf_workers)
+    chunks = chunk_docs(pages, chunk_size=2000, overlap=200)
+    return len(pages), chunks
+
+def _process_file_serial_pdf(fp: str):
+    # inside a file-level worker: one process per file already, so no nested page pool
+    return process_file(fp, pdf_workers=1)
+
+def file_signature(fp: str) -> list:
+    st = os.stat(fp)
+    return [st.st_mtime, st.st_size]
+
+def load_files_seen() -> dict:
+    if not os.path.exists(FILES_SEEN_PATH):
+        return {}
+    with open(FILES_SEEN_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_files_seen(files_seen: dict):
+    tmp_path = FILES_SEEN_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(files_seen, f, indent=2)
+    os.replace(tmp_path, FILES_SEEN_PATH)
+
 def main():
     client = genai.Client()
-    vdb = VectorDB(persist_dir="data/vdb", collection_name="docs")
+    vdb = VectorDB(persist_dir=VDB_DIR, collection_name="docs")
 
     raw_dir = "data/raw"
     os.makedirs(raw_dir, exist_ok=True)
@@ -48,90 +187,76 @@ def main():
         print("No files found in data/raw. Add pdf/txt/docx/md files and re-run ingest.")
         return
 
-    all_chunks = []
-    for fp in files:
-        pages = load_document(fp)
-        print(f"Loaded {os.path.basename(fp)}: {len(pages)} page(s)")
+    # Skip files whose mtime+size match a previous complete ingest (only trusted if the store has data)
+    files_seen = load_files_seen() if getattr(vdb, "_ids", []) else {}
+    signatures = {fp: file_signature(fp) for fp in files}
+    unchanged = [fp for fp in files if files_seen.get(fp) == signatures[fp]]
+    files = [fp for fp in files if fp not in unchanged]
+    for fp in unchanged:
+        print(f"Unchanged since last ingest, skipping: {os.path.basename(fp)}")
+
+    if not files:
+        vdb.build_index()  # stores from before the writer built indexes get theirs here
+        print("✅ Nothing to ingest: all files are unchanged.")
+        return
+
+    # Load + chunk is CPU-bound: spread files across cores (a single file uses the PDF page pool instead).
+    # Embedding stays in this process so rate limiting is centralized.
+    if len(files) == 1:
+        results = [process_file(files[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as ex:
+            results = list(ex.map(_process_file_serial_pdf, files))
 
-        chunks = chunk_docs(pages, chunk_size=2000, overlap=200)
-        print(f"Chunked {os.path.basename(fp)}: {len(chunks)} chunks")
-        all_chunks.extend(chunks)
+    all_texts, all_metas = [], []
+    for fp, (n_pages, chunks) in zip(files, results):
+        print(f"Loaded {os.path.basename(fp)}: {n_pages} page(s)")
+        print(f"Chunked {os.path.basename(fp)}: {len(chunks['texts'])} chunks")
+        all_texts.extend(chunks["texts"])
+        all_metas.extend(chunks["metadatas"])
 
-    print(f"Total chunks: {len(all_chunks)}")
-    if not all_chunks:
+    print(f"Total chunks: {len(all_texts)}")
+    if not all_texts:
         print("No text extracted. If PDFs are scanned images, try a .txt file first.")
         return
 
     # Resume-safe: skip IDs already stored (VectorDB loads these internally)
     existing_ids = set(getattr(vdb, "_ids", []))
 
-    items_in_window = 0
-    window_start = time.time()
-
-    def throttle_if_needed(about_to_send: int):
-        nonlocal items_in_window, window_start
-        now = time.time()
-
-        # reset window
-        if now - window_start >= WINDOW_SECONDS:
-            window_start = now
-            items_in_window = 0
-
-        # sleep until next window if limit would be exceeded
-        if items_in_window + about_to_send > ITEMS_PER_MIN_LIMIT:
-            sleep_s = WINDOW_SECONDS - (now - window_start)
-            if sleep_s > 0:
-                print(f"[rate-limit] sleeping {sleep_s:.1f}s to respect embed limit...")
-                time.sleep(sleep_s)
-            window_start = time.time()
-            items_in_window = 0
-
-    # Process + write PER BATCH (so you never lose progress)
-    for i in tqdm(range(0, len(all_chunks), BATCH_SIZE)):
-        batch = all_chunks[i:i + BATCH_SIZE]
-
-        batch_ids = []
-        batch_docs = []
-        batch_metas = []
-
-        for b in batch:
-            sid = stable_id(b["metadata"].get("source"), b["metadata"].get("page"), b["text"])
-            if sid in existing_ids:
-                continue
-            batch_ids.append(sid)
-            batch_docs.append(b["text"])
-            batch_metas.append(b["metadata"])
-
-        if not batch_docs:
+    # One pass over all chunks: ID each, keep only those not stored yet (and not repeated in this run)
+    seen = set()
+    new_chunks = []
+    for text, meta in zip(all_texts, all_metas):
+        sid = stable_id(meta.get("source"), meta.get("page"), text)
+        if sid in existing_ids or sid in seen:
             continue
+        seen.add(sid)
+        new_chunks.append((sid, text, meta))
 
-        throttle_if_needed(len(batch_docs))
-
-        try:
-            batch_embs = embed_batch(client, batch_docs)
-            items_in_window += len(batch_docs)
-        except ClientError as e:
-            # If rate-limited, wait and retry once
-            if "RESOURCE_EXHAUSTED" in str(e) or "429" in str(e):
-                print("[embed] 429 hit. Waiting ~55s and retrying once...")
-                time.sleep(55)
-                batch_embs = embed_batch(client, batch_docs)
-                items_in_window += len(batch_docs)
-            else:
-                print("\n❌ Gemini embeddings failed:")
-                print(e)
-                raise
+    print(f"New chunks to embed: {len(new_chunks)} (skipping {len(all_texts) - len(new_chunks)})")
+
+    # Full BATCH_SIZE batches of new chunks only
+    batches = []
+    for i in range(0, len(new_chunks), BATCH_SIZE):
+        window = new_chunks[i:i + BATCH_SIZE]
+        batches.append((
+            [sid for sid, _, _ in window],
+            [text for _, text, _ in window],
+            [meta for _, _, meta in window],
+        ))
 
-        vdb.add(
-            ids=batch_ids,
-            embeddings=batch_embs,
-            documents=batch_docs,
-            metadatas=batch_metas
-        )
-        existing_ids.update(batch_ids)
+    asyncio.run(ingest_all(client, vdb, batches))
+
+    # ANN index (HNSW / IVF-PQ) is built and saved here, on the writer side, so chat sessions just load it
+    vdb.build_index()
+
+    # Every chunk of these files is now stored: remember them so the next run can skip them
+    for fp in files:
+        files_seen[fp] = signatures[fp]
+    save_files_seen(files_seen)
 
     print("✅ Ingestion complete. VectorDB updated.")
-    print("✅ Files written to: data/vdb/ (docs_meta.jsonl, docs_emb.npy)")
+    print("✅ Files written to: data/vdb/ (docs_meta.jsonl, docs_emb.*, docs_emb.shape.json)")
 
 if __name__ == "__main__":
     main()
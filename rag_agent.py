@@ -1,3 +1,8 @@
+import os
+import hashlib
+from functools import lru_cache
+import diskcache
+import numpy as np
 from dotenv import load_dotenv
 from google import genai
 from google.genai.errors import ClientError
@@ -8,6 +13,8 @@ load_dotenv()
 # Use exactly one model (as you requested)
 GEN_MODEL = "gemini-2.5-flash"
 EMBED_MODEL = "gemini-embedding-001"
+QCACHE_DIR = "data/qcache"
+VDB_DIR = "data/vdb"
 
 SYSTEM = """You are an expert AI/ML assistant.
 You must answer ONLY using the provided context.
@@ -27,16 +34,87 @@ def format_context(docs, metas, distances, max_chars=9000):
     total = 0
     for d, m, dist in zip(docs, metas, distances):
         cite = f"[{m.get('source')}, page {m.get('page')}]"
-        chunk = f"{cite}\n{d}\n"
-        if total + len(chunk) > max_chars:
+        # measure before building, so chunks past the budget are never materialized
+        chunk_len = len(cite) + 1 + len(d) + 1
+        if total + chunk_len > max_chars:
             break
-        items.append(chunk)
-        total += len(chunk)
+        items.append(f"{cite}\n{d}\n")
+        total += chunk_len
     return "\n---\n".join(items)
 
-def embed_query(client: genai.Client, text: str) -> list[float]:
-    res = client.models.embed_content(model=EMBED_MODEL, contents=text)
-    return res.embeddings[0].values
+class QueryEmbedCache:
+    """
+    On-disk LRU of query embeddings (float32), keyed by a hash of model + query text,
+    so repeated questions skip the embedding API call across sessions.
+    """
+    def __init__(self, directory: str = QCACHE_DIR, size_limit: int = 100_000_000):
+        self._cache = diskcache.Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(f"{EMBED_MODEL}\n{text}".encode("utf-8", errors="ignore")).hexdigest()
+
+    def get(self, text: str):
+        return self._cache.get(self.key(text))
+
+    def set(self, text: str, vec: np.ndarray):
+        self._cache.set(self.key(text), vec)
+
+_query_cache = None
+_client = None
+_vdb = None
+_vdb_stamp = None
+
+def get_client() -> genai.Client:
+    # one client (and its HTTP connection pool) for the whole chat session
+    global _client
+    if _client is None:
+        _client = genai.Client()
+    return _client
+
+# files whose mtimes change whenever ingest commits rows (shape sidecar) or saves an ANN index;
+# names follow VectorDB's f"{collection_name}_..." layout for the "docs" collection
+_VDB_STAMP_FILES = ("docs_emb.shape.json", "docs_hnsw.bin", "docs_ivfpq.faiss")
+
+def _vdb_stamp_now():
+    stamp = []
+    for name in _VDB_STAMP_FILES:
+        try:
+            stamp.append(os.stat(os.path.join(VDB_DIR, name)).st_mtime_ns)
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+def get_vdb() -> VectorDB:
+    # reuse the loaded store across turns; reload only if ingest has changed it since.
+    # read_only: an ingest may be mid-add(), so never truncate/remove its files from here
+    global _vdb, _vdb_stamp
+    stamp = _vdb_stamp_now()
+    if _vdb is None or stamp != _vdb_stamp:
+        # stamp taken *before* loading: a commit landing during the load changes the files again,
+        # so the next turn sees a different stamp and reloads instead of keeping a stale store
+        _vdb = VectorDB(persist_dir=VDB_DIR, collection_name="docs", read_only=True)
+        _vdb_stamp = stamp
+    return _vdb
+
+def get_query_cache() -> QueryEmbedCache:
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryEmbedCache()
+    return _query_cache
+
+@lru_cache(maxsize=256)
+def embed_query(client: genai.Client, text: str) -> np.ndarray:
+    # in-process LRU for the hottest queries, backed by the on-disk cache
+    cache = get_query_cache()
+    vec = cache.get(text)
+    if vec is None:
+        res = client.models.embed_content(model=EMBED_MODEL, contents=[text])  # list form: batchable later
+        vec = np.asarray(res.embeddings[0].values, dtype=np.float32)
+        vec /= (np.linalg.norm(vec) + 1e-12)  # unit-norm at embed time; cached already normalized
+        cache.set(text, vec)
+    vec.setflags(write=False)  # shared between cache hits
+    return vec
 
 def retrieve(client: genai.Client, vdb: VectorDB, query: str, top_k: int = 6):
     q_emb = embed_query(client, query)
@@ -47,10 +125,10 @@ def retrieve(client: genai.Client, vdb: VectorDB, query: str, top_k: int = 6):
     return docs, metas, distances
 
 def agentic_answer(query: str) -> str:
-    client = genai.Client()
+    client = get_client()
 
-    # ✅ NumPy VectorDB location
-    vdb = VectorDB(persist_dir="data/vdb", collection_name="docs")
+    # ✅ NumPy VectorDB location (cached across turns)
+    vdb = get_vdb()
 
     # ✅ Guard: no docs indexed yet
     if not getattr(vdb, "_ids", []):
@@ -1,89 +1,493 @@
 import os
 import json
 import numpy as np
+import orjson
 from typing import List, Dict, Any, Optional
 
-def _cosine_sim_matrix(query_vec: np.ndarray, mat: np.ndarray) -> np.ndarray:
-    # query_vec: (d,), mat: (n,d)
-    q = query_vec / (np.linalg.norm(query_vec) + 1e-12)
-    m = mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12)
-    return m @ q  # (n,)
+try:
+    import hnswlib  # optional: approximate search for large stores
+except ImportError:
+    hnswlib = None
+
+try:
+    import faiss  # optional: IVF-PQ compressed coarse search for very large stores
+except ImportError:
+    faiss = None
+
+try:
+    import numba  # optional: fused scoring + top-k kernel for large stores
+except ImportError:
+    numba = None
+
+# below this many rows exact brute force is fast enough and has perfect recall
+HNSW_MIN_ROWS = 5000
+HNSW_SAVE_EVERY = 1000  # rows added between index snapshots
+
+# IVF-PQ: codes of PQ_SUBQUANTIZERS bytes per row; top_k * PQ_RERANK_FACTOR candidates re-scored exactly
+# exact int8/fused scoring is ~1ms at tens of thousands of rows; PQ only pays off (RAM, latency)
+# once the store is far larger than that, and it costs recall + a training pass
+PQ_MIN_ROWS = 500_000
+PQ_SUBQUANTIZERS = 48
+PQ_RERANK_FACTOR = 32
+PQ_TRAIN_ROWS = 100_000  # sample size for coarse centroid + codebook training
+PQ_SAVE_EVERY = 1000
+
+# on-disk row formats: raw float32, or int8 with one float32 scale per row
+EMB_DTYPES = ("float32", "int8")
+SCORE_BLOCK_ROWS = 4096  # int8 rows widened to float32 per block, keeps the temp cache-sized
+FUSED_MIN_ROWS = 10_000  # below this the NumPy path wins (no kernel dispatch / merge overhead)
+
+def _l2_normalize_rows(mat: np.ndarray) -> np.ndarray:
+    # in-place row normalization, mat: (n,d) float32
+    mat /= (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12)
+    return mat
+
+def _unit_query(embedding) -> np.ndarray:
+    # (d,) C-contiguous float32 unit vector; asarray avoids a copy when already float32
+    q = np.asarray(embedding, dtype=np.float32)
+    return np.ascontiguousarray(q / (np.linalg.norm(q) + 1e-12), dtype=np.float32)
+
+def _cosine_sim_matrix(q_hat: np.ndarray, mat: np.ndarray) -> np.ndarray:
+    # q_hat: (d,) unit float32 (see _unit_query), mat: (n,d) with rows already L2-normalized
+    # both operands C-contiguous float32 so np.dot dispatches straight to BLAS sgemv
+    # (a float64 query would silently upcast a full (n,d) copy of mat)
+    return np.dot(np.ascontiguousarray(mat), q_hat)  # (n,)
+
+def _append_durable(path: str, data: bytes):
+    # rows and metadata must hit disk before the shape sidecar that makes them visible
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _quantize_rows_int8(mat: np.ndarray):
+    # symmetric per-row quantization: row ~= q_row * scale
+    scales = (np.abs(mat).max(axis=1) / 127.0).astype(np.float32) + 1e-12
+    q = np.round(mat / scales[:, None]).astype(np.int8)
+    return q, scales
+
+def _cosine_sim_int8(q_hat: np.ndarray, mat_i8: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    # same as _cosine_sim_matrix on dequantized rows, without materializing an (n,d) float32 copy
+    sims = np.empty(mat_i8.shape[0], dtype=np.float32)
+    for start in range(0, mat_i8.shape[0], SCORE_BLOCK_ROWS):
+        stop = start + SCORE_BLOCK_ROWS
+        sims[start:stop] = mat_i8[start:stop].astype(np.float32) @ q_hat
+    sims *= scales
+    return sims
+
+if numba is not None:
+    # only reassoc/contract (enough to vectorize the dot product); full fastmath implies ninf/nnan
+    @numba.njit(parallel=True, fastmath={"reassoc", "contract"}, cache=True)
+    def _topk_cosine_kernel(mat, scales, q, k, n_blocks):
+        # each block keeps its own k best (sim, idx) without ever writing an (n,) sims array;
+        # with small k a linear scan for the current minimum is as cheap as a heap
+        n, d = mat.shape
+        block = (n + n_blocks - 1) // n_blocks
+        # finite sentinel below any cosine (>= -1); empty slots are dropped via idx == -1 anyway
+        cand_sims = np.full((n_blocks, k), -2.0, dtype=np.float32)
+        cand_idx = np.full((n_blocks, k), -1, dtype=np.int64)
+        for b in numba.prange(n_blocks):
+            lo = 0
+            for i in range(b * block, min((b + 1) * block, n)):
+                s = np.float32(0.0)
+                for j in range(d):
+                    s += mat[i, j] * q[j]
+                if scales.size > 0:
+                    s *= scales[i]
+                if s > cand_sims[b, lo]:
+                    cand_sims[b, lo] = s
+                    cand_idx[b, lo] = i
+                    lo = 0
+                    for t in range(1, k):
+                        if cand_sims[b, t] < cand_sims[b, lo]:
+                            lo = t
+        return cand_sims, cand_idx
+
+def _topk_cosine_fused(q_hat: np.ndarray, mat: np.ndarray, scales: Optional[np.ndarray], top_k: int):
+    # returns (idx, sims) of the top_k rows, best first
+    if scales is None:
+        scales = np.empty(0, dtype=np.float32)
+    n_blocks = 4 * numba.config.NUMBA_NUM_THREADS
+    cand_sims, cand_idx = _topk_cosine_kernel(mat, scales, q_hat, top_k, n_blocks)
+    cand_sims, cand_idx = cand_sims.ravel(), cand_idx.ravel()
+    keep = cand_idx >= 0
+    cand_sims, cand_idx = cand_sims[keep], cand_idx[keep]
+    best = _top_k_indices(cand_sims, top_k)
+    return cand_idx[best], cand_sims[best]
+
+def _pq_subquantizers(d: int) -> int:
+    # PQ needs M | d: take the largest divisor of d not above PQ_SUBQUANTIZERS
+    return max(m for m in range(1, min(PQ_SUBQUANTIZERS, d) + 1) if d % m == 0)
+
+def _top_k_indices(sims: np.ndarray, top_k: int) -> np.ndarray:
+    # O(n + k log k): partition out the k best, then sort only those
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if top_k >= sims.size:
+        return np.argsort(-sims)
+    idx_part = np.argpartition(-sims, top_k - 1)[:top_k]
+    return idx_part[np.argsort(-sims[idx_part])]
 
 class VectorDB:
     """
     Simple persistent vector store using:
-      - data/vdb_meta.jsonl (one JSON per chunk: id, document, metadata)
-      - data/vdb_emb.npy     (NxD float32 matrix)
+      - data/vdb/docs_meta.jsonl       (one JSON per chunk: id, document, metadata)
+      - data/vdb/docs_emb.f32          (raw NxD float32 rows, L2-normalized, append-only)
+          or docs_emb.i8 + docs_emb_scale.f32 (int8 rows + per-row scales)
+      - data/vdb/docs_emb.shape.json   ({"n": N, "d": D, "dtype": ...} for the raw file)
+    Embeddings are memory-mapped for queries, so nothing is copied on load.
+    `emb_dtype` only applies to new stores; existing ones keep the dtype in their sidecar.
+    `read_only=True` is for readers running alongside an ingest: it trusts only the committed
+    count in the sidecar and never truncates, rewrites or removes files.
     Interface matches your earlier Chroma VectorDB: add() and query()
     """
-    def __init__(self, persist_dir: str = "data/vdb", collection_name: str = "docs"):
+    def __init__(self, persist_dir: str = "data/vdb", collection_name: str = "docs", emb_dtype: str = "int8",
+                 read_only: bool = False):
+        if emb_dtype not in EMB_DTYPES:
+            raise ValueError(f"Unsupported emb_dtype: {emb_dtype}")
         self.persist_dir = persist_dir
         self.collection_name = collection_name
+        self.read_only = read_only
         os.makedirs(self.persist_dir, exist_ok=True)
 
         self.meta_path = os.path.join(self.persist_dir, f"{collection_name}_meta.jsonl")
-        self.emb_path = os.path.join(self.persist_dir, f"{collection_name}_emb.npy")
+        self.scale_path = os.path.join(self.persist_dir, f"{collection_name}_emb_scale.f32")
+        self.shape_path = os.path.join(self.persist_dir, f"{collection_name}_emb.shape.json")
+        self._legacy_emb_path = os.path.join(self.persist_dir, f"{collection_name}_emb.npy")
+        self.hnsw_path = os.path.join(self.persist_dir, f"{collection_name}_hnsw.bin")
+        self.pq_path = os.path.join(self.persist_dir, f"{collection_name}_ivfpq.faiss")
 
         self._metas: List[Dict[str, Any]] = []
         self._docs: List[str] = []
         self._ids: List[str] = []
-        self._emb: Optional[np.ndarray] = None  # shape (n,d)
+        self._emb: Optional[np.ndarray] = None  # shape (n,d), read-only memmap
+        self._scales: Optional[np.ndarray] = None  # shape (n,), int8 stores only
+        self._n = 0
+        self._d = 0
+        self._hnsw = None  # hnswlib.Index over rows 0..n-1, when enabled
+        self._hnsw_unsaved = 0
+        self._pq = None  # faiss.IndexIVFPQ over rows 0..n-1, when enabled
+        self._pq_unsaved = 0
+        self._set_dtype(emb_dtype)
 
         self._load()
 
+    def _set_dtype(self, dtype: str):
+        self._dtype = dtype
+        ext = "f32" if dtype == "float32" else "i8"
+        self.emb_path = os.path.join(self.persist_dir, f"{self.collection_name}_emb.{ext}")
+
+    def _read_shape(self):
+        with open(self.shape_path, "r", encoding="utf-8") as f:
+            shape = json.load(f)
+        # stores written before quantization have no dtype field
+        return int(shape["n"]), int(shape["d"]), shape.get("dtype", "float32")
+
+    def _write_shape(self, n: int, d: int):
+        # the sidecar is the commit point for appended rows + metadata: write it last, and atomically,
+        # so a crash leaves either the old or the new shape (uncommitted tails are truncated on load)
+        tmp_path = self.shape_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"n": n, "d": d, "dtype": self._dtype}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.shape_path)
+
+    def _map_emb(self):
+        if self._n == 0:
+            self._emb, self._scales = None, None
+            return
+        self._emb = np.memmap(self.emb_path, dtype=np.dtype(self._dtype), mode="r", shape=(self._n, self._d))
+        if self._dtype == "int8":
+            self._scales = np.memmap(self.scale_path, dtype=np.float32, mode="r", shape=(self._n,))
+
+    def _rows_f32(self, start: int, stop: int) -> np.ndarray:
+        rows = np.asarray(self._emb[start:stop], dtype=np.float32)
+        if self._dtype == "int8":
+            rows *= self._scales[start:stop, None]
+        return rows
+
+    def _rows_f32_at(self, idx: np.ndarray) -> np.ndarray:
+        # gather only the requested rows from the memmap (idx sorted for sequential reads)
+        rows = np.asarray(self._emb[idx], dtype=np.float32)
+        if self._dtype == "int8":
+            rows *= self._scales[idx, None]
+        return rows
+
+    def _read_legacy_npy(self) -> np.ndarray:
+        # older stores kept a full .npy matrix (possibly un-normalized rows)
+        emb = np.load(self._legacy_emb_path).astype(np.float32, copy=False)
+        if emb.shape[0] > 0 and abs(float(np.linalg.norm(emb[0])) - 1.0) > 1e-3:
+            emb = _l2_normalize_rows(emb)
+        return emb
+
+    def _migrate_legacy_npy(self):
+        # one-time migration to the append-only raw format
+        emb = self._read_legacy_npy()
+        self._set_dtype("float32")
+        with open(self.emb_path, "wb") as f:
+            f.write(np.ascontiguousarray(emb).tobytes())
+        self._write_shape(emb.shape[0], emb.shape[1])
+        os.remove(self._legacy_emb_path)
+
+    def _committed_rows_on_disk(self, n: int) -> int:
+        # rows fully present in the embedding (and scale) files, capped at the sidecar's n
+        if n == 0 or not os.path.exists(self.emb_path):
+            return 0
+        rows = min(n, os.path.getsize(self.emb_path) // (self._d * np.dtype(self._dtype).itemsize))
+        if self._dtype == "int8":
+            rows = min(rows, os.path.getsize(self.scale_path) // 4 if os.path.exists(self.scale_path) else 0)
+        return rows
+
+    def _read_meta(self, limit: int) -> int:
+        # parse at most `limit` complete records; returns the byte offset just past the last one kept
+        offset = 0
+        if not os.path.exists(self.meta_path):
+            return offset
+        with open(self.meta_path, "rb") as f:
+            while len(self._ids) < limit:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # EOF, or a record cut off mid-write
+                try:
+                    rec = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    break
+                self._ids.append(rec["id"])
+                self._docs.append(rec["document"])
+                self._metas.append(rec["metadata"])
+                offset += len(line)
+        return offset
+
     def _load(self):
-        if os.path.exists(self.meta_path):
-            with open(self.meta_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    rec = json.loads(line)
-                    self._ids.append(rec["id"])
-                    self._docs.append(rec["document"])
-                    self._metas.append(rec["metadata"])
-
-        if os.path.exists(self.emb_path):
-            self._emb = np.load(self.emb_path)
+        legacy_emb = None
+        if os.path.exists(self._legacy_emb_path) and not os.path.exists(self.shape_path):
+            if self.read_only:
+                legacy_emb = self._read_legacy_npy()  # serve it from memory; the writer migrates it
+            else:
+                self._migrate_legacy_npy()
+
+        n = 0
+        if os.path.exists(self.shape_path):
+            n, self._d, dtype = self._read_shape()
+            self._set_dtype(dtype)
+
+        # The shape sidecar is the commit point: add() writes rows, then metadata, then the sidecar.
+        # Anything past the committed count (crash or in-progress add) is an uncommitted tail:
+        # readers ignore it, the writer truncates it. The committed prefix is never reset.
+        if legacy_emb is not None:
+            self._set_dtype("float32")
+            self._d = legacy_emb.shape[1]
+            n_rows = legacy_emb.shape[0]
         else:
-            self._emb = None
+            n_rows = self._committed_rows_on_disk(n)
+        meta_end = self._read_meta(n_rows)
+        self._n = len(self._ids)
+
+        if self.read_only:
+            if legacy_emb is not None:
+                self._emb = legacy_emb[:self._n] if self._n else None
+            else:
+                self._map_emb()
+            if faiss is not None and self._n >= PQ_MIN_ROWS and os.path.exists(self.pq_path):
+                self._load_pq()
+            elif hnswlib is not None and self._n >= HNSW_MIN_ROWS and os.path.exists(self.hnsw_path):
+                self._load_hnsw()
+            return
+
+        sizes = {
+            self.meta_path: meta_end,
+            self.emb_path: self._n * self._d * np.dtype(self._dtype).itemsize,
+            self.scale_path: self._n * 4,
+        }
+        for path, size in sizes.items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        if self._n != n:
+            self._write_shape(self._n, self._d)
+        self._map_emb()
+
+        if faiss is not None and self._n >= PQ_MIN_ROWS and os.path.exists(self.pq_path):
+            self._load_pq()
+        elif hnswlib is not None and self._n >= HNSW_MIN_ROWS and os.path.exists(self.hnsw_path):
+            self._load_hnsw()
+
+    def _load_hnsw(self):
+        index = hnswlib.Index(space="ip", dim=self._d)  # rows are unit-norm, so ip == cosine
+        index.load_index(self.hnsw_path, max_elements=self._n)
+        n_indexed = index.get_current_count()
+        if n_indexed > self._n:
+            # index is ahead of the embeddings (e.g. store was reset): the next build_index() rebuilds it
+            if not self.read_only:
+                os.remove(self.hnsw_path)
+            return
+        if n_indexed < self._n:
+            # catch up rows appended after the last snapshot
+            index.add_items(self._rows_f32(n_indexed, self._n), ids=np.arange(n_indexed, self._n))
+            if not self.read_only:
+                self._save_hnsw(index)
+        self._hnsw = index
+
+    def _save_hnsw(self, index):
+        # readers may load the index while ingest runs: never expose a half-written file
+        tmp_path = self.hnsw_path + ".tmp"
+        index.save_index(tmp_path)
+        os.replace(tmp_path, self.hnsw_path)
+
+    def _build_hnsw(self):
+        index = hnswlib.Index(space="ip", dim=self._d)
+        index.init_index(max_elements=self._n, ef_construction=200, M=16)
+        index.add_items(self._rows_f32(0, self._n), ids=np.arange(self._n))
+        self._save_hnsw(index)
+        self._hnsw = index
+        self._hnsw_unsaved = 0
 
-        # sanity: if meta exists but emb missing, reset meta to avoid mismatch
-        if (self._emb is None and len(self._ids) > 0) or (self._emb is not None and self._emb.shape[0] != len(self._ids)):
-            # reset everything if mismatch
-            self._ids, self._docs, self._metas, self._emb = [], [], [], None
-            if os.path.exists(self.meta_path):
-                os.remove(self.meta_path)
-            if os.path.exists(self.emb_path):
-                os.remove(self.emb_path)
+    def _load_pq(self):
+        index = faiss.read_index(self.pq_path)
+        n_indexed = index.ntotal
+        if n_indexed > self._n or index.d != self._d:
+            # index doesn't match the embeddings (e.g. store was reset): the next build_index() rebuilds it
+            if not self.read_only:
+                os.remove(self.pq_path)
+            return
+        if n_indexed < self._n:
+            # catch up rows appended after the last snapshot (IVF ids are sequential, like our rows)
+            index.add(self._rows_f32(n_indexed, self._n))
+            if not self.read_only:
+                self._save_pq(index)
+        self._pq = index
+
+    def _save_pq(self, index):
+        # readers may load the index while ingest runs: never expose a half-written file
+        tmp_path = self.pq_path + ".tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.pq_path)
+
+    def _build_pq(self):
+        nlist = int(min(4 * np.sqrt(self._n), self._n // 39))  # ~39 training points per centroid
+        quantizer = faiss.IndexFlatIP(self._d)
+        index = faiss.IndexIVFPQ(quantizer, self._d, nlist, _pq_subquantizers(self._d), 8, faiss.METRIC_INNER_PRODUCT)
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(self._n, size=min(self._n, PQ_TRAIN_ROWS), replace=False))
+        index.train(self._rows_f32_at(sample))
+        for start in range(0, self._n, SCORE_BLOCK_ROWS):
+            index.add(self._rows_f32(start, min(start + SCORE_BLOCK_ROWS, self._n)))
+        self._save_pq(index)
+        self._pq = index
+        self._pq_unsaved = 0
+
+    def _query_pq(self, q_hat: np.ndarray, top_k: int):
+        # coarse PQ search for a candidate pool, then exact re-rank against the stored rows
+        self._pq.nprobe = max(8, self._pq.nlist // 16)
+        _, labels = self._pq.search(q_hat[None, :], min(self._n, top_k * PQ_RERANK_FACTOR))
+        cand = np.sort(labels[0][labels[0] >= 0])
+        sims = self._rows_f32_at(cand) @ q_hat
+        best = _top_k_indices(sims, top_k)
+        return cand[best], sims[best]
 
     def add(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]):
-        emb_new = np.array(embeddings, dtype=np.float32)
+        if self.read_only:
+            raise RuntimeError("VectorDB was opened read_only; add() is not allowed")
+        emb_new = _l2_normalize_rows(np.array(embeddings, dtype=np.float32))
+
+        # append only the new rows; the existing files are never rewritten
+        if self._dtype == "int8":
+            emb_q, scales = _quantize_rows_int8(emb_new)
+            _append_durable(self.emb_path, emb_q.tobytes())
+            _append_durable(self.scale_path, scales.tobytes())
+        else:
+            _append_durable(self.emb_path, emb_new.tobytes())
 
-        # append metadata
-        with open(self.meta_path, "a", encoding="utf-8") as f:
-            for i, doc, meta in zip(ids, documents, metadatas):
-                f.write(json.dumps({"id": i, "document": doc, "metadata": meta}, ensure_ascii=False) + "\n")
+        # then metadata, then the sidecar that commits both (see _load)
+        _append_durable(self.meta_path, b"".join(
+            orjson.dumps({"id": i, "document": doc, "metadata": meta}, option=orjson.OPT_APPEND_NEWLINE)
+            for i, doc, meta in zip(ids, documents, metadatas)
+        ))
 
         self._ids.extend(ids)
         self._docs.extend(documents)
         self._metas.extend(metadatas)
 
-        # append embeddings
-        if self._emb is None:
-            self._emb = emb_new
-        else:
-            self._emb = np.vstack([self._emb, emb_new])
+        old_n = self._n
+        self._n += emb_new.shape[0]
+        self._d = emb_new.shape[1]
+        self._write_shape(self._n, self._d)
+        self._map_emb()
+
+        if self._pq is not None:
+            self._pq.add(emb_new)
+            self._pq_unsaved += emb_new.shape[0]
+            if self._pq_unsaved >= PQ_SAVE_EVERY:
+                self._save_pq(self._pq)
+                self._pq_unsaved = 0
+
+        if self._hnsw is not None:
+            if self._n > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(max(self._n, 2 * self._hnsw.get_max_elements()))
+            self._hnsw.add_items(emb_new, ids=np.arange(old_n, self._n))
+            self._hnsw_unsaved += emb_new.shape[0]
+            if self._hnsw_unsaved >= HNSW_SAVE_EVERY:
+                self._save_hnsw(self._hnsw)
+                self._hnsw_unsaved = 0
 
-        np.save(self.emb_path, self._emb)
+    def build_index(self):
+        """
+        Build (or bring up to date) the ANN index for the current store size and save it.
+        Called by the writer at the end of ingest; queries only use an index that already exists.
+        """
+        if self.read_only:
+            raise RuntimeError("VectorDB was opened read_only; build_index() is not allowed")
+        if faiss is not None and self._n >= PQ_MIN_ROWS:
+            if self._pq is None:
+                print(f"[vdb] training IVF-PQ index over {self._n} vectors...")
+                self._build_pq()
+            elif self._pq_unsaved:
+                self._save_pq(self._pq)
+                self._pq_unsaved = 0
+            # PQ supersedes HNSW for this store
+            self._hnsw = None
+            if os.path.exists(self.hnsw_path):
+                os.remove(self.hnsw_path)
+        elif hnswlib is not None and self._n >= HNSW_MIN_ROWS:
+            if self._hnsw is None:
+                print(f"[vdb] building HNSW index over {self._n} vectors...")
+                self._build_hnsw()
+            elif self._hnsw_unsaved:
+                self._save_hnsw(self._hnsw)
+                self._hnsw_unsaved = 0
 
     def query(self, embedding: List[float], top_k: int = 6):
         if self._emb is None or self._emb.shape[0] == 0:
             return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
 
-        q = np.array(embedding, dtype=np.float32)
-        sims = _cosine_sim_matrix(q, self._emb)  # higher is better
-        idx = np.argsort(-sims)[:top_k]
+        # normalize once; every scoring path below takes the unit query
+        q_hat = _unit_query(embedding)
+
+        # ANN paths only when an index was built by build_index() (never trained per query/session)
+        if self._pq is not None and top_k > 0:
+            idx, sims = self._query_pq(q_hat, top_k)
+            idx = idx.tolist()
+            distances = [float(1.0 - s) for s in sims]
+        elif self._hnsw is not None and top_k > 0:
+            k = min(top_k, self._n)
+            self._hnsw.set_ef(max(64, 2 * k))
+            labels, dists = self._hnsw.knn_query(q_hat, k=k)
+            idx = labels[0].tolist()
+            distances = [float(x) for x in dists[0]]  # ip space: 1 - sim
+        elif numba is not None and self._n > FUSED_MIN_ROWS and top_k > 0:
+            idx, sims = _topk_cosine_fused(q_hat, self._emb, self._scales, min(top_k, self._n))
+            idx = idx.tolist()
+            distances = [float(1.0 - s) for s in sims]
+        else:
+            if self._dtype == "int8":
+                sims = _cosine_sim_int8(q_hat, self._emb, self._scales)  # higher is better
+            else:
+                sims = _cosine_sim_matrix(q_hat, self._emb)  # higher is better
+            idx = _top_k_indices(sims, top_k)
+            distances = [float(1.0 - sims[i]) for i in idx]  # convert sim -> distance-like
 
         docs = [self._docs[i] for i in idx]
         metas = [self._metas[i] for i in idx]
-        distances = [float(1.0 - sims[i]) for i in idx]  # convert sim -> distance-like
 
         return {"documents": [docs], "metadatas": [metas], "distances": [distances]}